@@ -21,14 +21,25 @@
 from ._base import BaseBiclusteringAlgorithm
 from ..models import Bicluster, Biclustering
 from sklearn.preprocessing import scale
-from scipy.stats import norm
-from operator import itemgetter
 from sklearn.utils.validation import check_array
+from scipy.special import gammaln
+from numba import njit, prange, get_num_threads
 
-import bottleneck as bn
 import numpy as np
 import math
-import random
+
+# the top-k selections use a min-heap only when k * _HEAP_SELECTION_RATIO <= n, because the
+# O(n log k) heap is slower than the O(n) quickselect when k is a sizable fraction of n
+_HEAP_SELECTION_RATIO = 8
+
+# top-k selections with k up to _SMALL_K keep the k largest values in a sorted buffer
+_SMALL_K = 32
+
+# number of randomized searches whose initial row sums are computed by a single matrix product
+_SEARCH_BATCH_SIZE = 256
+
+_SQRT2 = math.sqrt(2.0)
+_LOG_SQRT_2PI = 0.5 * math.log(2.0 * math.pi)
 
 class LargeAverageSubmatrices(BaseBiclusteringAlgorithm):
     """Large Average Submatrices (LAS)
@@ -69,6 +80,7 @@ class LargeAverageSubmatrices(BaseBiclusteringAlgorithm):
         self.scale_data = scale_data
         self.transform = transform
         self.tol = tol
+        self._log_combs_cache = {}
 
     def run(self, data):
         """Compute biclustering.
@@ -84,114 +96,489 @@ class LargeAverageSubmatrices(BaseBiclusteringAlgorithm):
             data = scale(data)
 
         if self.transform:
-            data = np.sign(data) * np.log(1 + np.abs(data))
-
             if self.scale_data:
-                data = scale(data)
+                _transform_and_scale(data)
+            else:
+                data = np.sign(data) * np.log1p(np.abs(data))
+
+        num_rows, num_cols = data.shape
+
+        # the searches only rank rows and columns by their sums, so single precision is enough for the
+        # data and halves the memory traffic of the kernels, which still accumulate in double precision
+        data = np.ascontiguousarray(data, dtype=np.float32)
+
+        # summing a few columns over all rows is done on a Fortran-ordered copy, where each column is contiguous
+        data_F = np.asfortranarray(data)
+
+        self._row_log_combs = self._log_combs(num_rows)[1:] # self._log_combs(num_rows)[1:] discards the case where the bicluster has 0 rows
+        self._col_log_combs = self._log_combs(num_cols)[1:] # self._log_combs(num_cols)[1:] discards the case where the bicluster has 0 columns
 
         biclusters = []
 
         for i in range(self.num_biclusters):
-            best, avg, score = max((self._find_bicluster(data) for i in range(self.randomized_searches)), key=itemgetter(-1))
+            best, avg, score = self._find_bicluster(data, data_F)
 
             if score < self.score_threshold:
                 break
 
-            data[np.ix_(best.rows, best.cols)] -= avg
+            _subtract_block(data, best.rows, best.cols, avg)
+            _subtract_block(data_F.T, best.cols, best.rows, avg) # the transpose of data_F is C-ordered, so its inner loop is contiguous
             biclusters.append(best)
 
         return Biclustering(biclusters)
 
-    def _find_bicluster(self, data):
-        """The basic bicluster search procedure. Each run of this method returns a submatrix
-        that is a local maximum of the score function adopted.
+    def _find_bicluster(self, data, data_F):
+        """Performs the randomized searches in parallel and returns the submatrix with the largest
+        score among the local maxima found by them.
         """
-        b = self._find_constrained_bicluster(data)
-        return self._improve_bicluster(data, b)
-
-    def _find_constrained_bicluster(self, data):
-        """Find a k x l bicluster."""
         num_rows, num_cols = data.shape
 
-        k = random.randint(1, math.ceil(num_rows / 2))
-        l = random.randint(1, math.ceil(num_cols / 2))
+        rows = np.empty(num_rows, dtype=np.int64)
+        cols = np.empty(num_cols, dtype=np.int64)
+        scratch = _search_scratch(num_rows, num_cols)
+        best_score = -np.inf
 
-        cols = np.random.choice(num_cols, size=l, replace=False)
+        for start in range(0, self.randomized_searches, _SEARCH_BATCH_SIZE):
+            batch_size = min(_SEARCH_BATCH_SIZE, self.randomized_searches - start)
 
-        old_avg, avg = float('-inf'), 0.0
+            ks = np.random.randint(1, math.ceil(num_rows / 2) + 1, size=batch_size)
+            ls = np.random.randint(1, math.ceil(num_cols / 2) + 1, size=batch_size)
+            col_perms = np.argsort(np.random.random_sample((batch_size, num_cols)), axis=1) # the first ls[i] columns of col_perms[i] start the i-th search
 
-        while abs(avg - old_avg) > self.tol:
-            old_avg = avg
+            # the row sums of the first iteration of all searches in the batch are computed by a
+            # single matrix product with the indicator vectors of their initial columns
+            indicators = np.zeros((batch_size, num_cols), dtype=data.dtype)
+            np.put_along_axis(indicators, col_perms, np.arange(num_cols) < ls[:, np.newaxis], axis=1)
+            init_row_sums = np.dot(indicators, data_F.T)
 
-            row_sums = np.sum(data[:, cols], axis=1)
-            rows = bn.argpartition(row_sums, num_rows - k)[-k:] # this is usually faster than rows = np.argsort(row_sums)[-k:]
+            scores = _run_searches_nb(data, data_F, ks, ls, col_perms, init_row_sums, self._row_log_combs, self._col_log_combs, self.tol, get_num_threads())
+            i = np.argmax(scores)
 
-            col_sums = np.sum(data[rows, :], axis=0)
-            cols = bn.argpartition(col_sums, num_cols - l)[-l:] # this is usually faster than cols = np.argsort(col_sums)[-l:]
+            if scores[i] > best_score:
+                # the searches are deterministic, so only the best one needs to be repeated in order to recover its rows and columns
+                num_b_rows, num_b_cols, avg, best_score = _search_nb(data, data_F, ks[i], ls[i], col_perms[i], init_row_sums[i],
+                                                                     self._row_log_combs, self._col_log_combs, self.tol, rows, cols, scratch)
 
-            avg = np.mean(data[np.ix_(rows, cols)])
+        return Bicluster(rows[:num_b_rows], cols[:num_b_cols]), avg, best_score
 
-        return Bicluster(rows, cols)
+    def _log_combs(self, n):
+        """Calculates the log of n choose k for k ranging from 0 to n. The results are memoized by n,
+        so they are reused by subsequent runs on datasets with the same number of rows or columns."""
+        if n not in self._log_combs_cache:
+            k = np.arange(n + 1)
+            self._log_combs_cache[n] = gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1) # log n! - log k! - log (n - k)!
 
-    def _improve_bicluster(self, data, b):
-        """Relaxes the k x l bicluster constraint in order to maximize the score function locally."""
-        num_rows, num_cols = data.shape
+        return self._log_combs_cache[n]
 
-        row_range = np.arange(1, num_rows + 1)
-        col_range = np.arange(1, num_cols + 1)
+    def _validate_parameters(self):
+        if self.num_biclusters <= 0:
+            raise ValueError("num_biclusters must be > 0, got {}".format(num_biclusters))
 
-        row_log_combs = self._log_combs(num_rows)[1:] # self._log_combs(num_rows)[1:] discards the case where the bicluster has 0 rows
-        col_log_combs = self._log_combs(num_cols)[1:] # self._log_combs(num_cols)[1:] discards the case where the bicluster has 0 columns
+        if self.randomized_searches <= 0:
+            raise ValueError("randomized_searches must be > 0, got {}".format(self.randomized_searches))
 
-        old_score, score = float('-inf'), 0.0
+        if not isinstance(self.transform, bool):
+            raise ValueError("transform must be either True or False, got {}".format(self.transform))
 
-        while abs(score - old_score) > self.tol:
-            old_score = score
+        if self.tol <= 0.0:
+            raise ValueError("tol must be a small double > 0.0, got {}".format(self.tol))
 
-            row_sums = np.sum(data[:, b.cols], axis=1)
-            order = np.argsort(-row_sums)
-            row_cumsum = np.cumsum(row_sums[order])
-            row_scores = self._scores(row_range, len(b.cols), row_cumsum, row_log_combs, col_log_combs)
-            rmax = np.argmax(row_scores) # searches for the number of rows that maximizes the score
-            b.rows = order[:rmax+1]
 
-            col_sums = np.sum(data[b.rows, :], axis=0)
-            order = np.argsort(-col_sums)
-            col_cumsum = np.cumsum(col_sums[order])
-            col_scores = self._scores(col_range, len(b.rows), col_cumsum, col_log_combs, row_log_combs)
-            cmax = np.argmax(col_scores) # searches for the number of columns that maximizes the score
-            b.cols = order[:cmax+1]
+@njit(cache=True, parallel=True)
+def _run_searches_nb(data, data_F, ks, ls, col_perms, init_row_sums, row_log_combs, col_log_combs, tol, num_threads):
+    """Runs the independent searches in parallel and returns the scores of the submatrices found.
+    The searches are split into one strided chunk per thread, so that each thread allocates its
+    scratch buffers only once."""
+    num_rows, num_cols = data.shape
+    num_searches = ks.size
+    num_chunks = min(num_threads, num_searches)
+    scores = np.empty(num_searches)
 
-            avg = col_cumsum[cmax] / b.area
-            score = col_scores[cmax]
+    for c in prange(num_chunks):
+        rows = np.empty(num_rows, dtype=np.int64)
+        cols = np.empty(num_cols, dtype=np.int64)
+        scratch = _search_scratch(num_rows, num_cols)
 
-        return b, avg, score
+        for s in range(c, num_searches, num_chunks):
+            scores[s] = _search_nb(data, data_F, ks[s], ls[s], col_perms[s], init_row_sums[s], row_log_combs, col_log_combs, tol, rows, cols, scratch)[3]
 
-    def _scores(self, range_, k, cumsum, m_log_combs, n_log_combs):
-        """Calculates the score function for all possible numbers of rows (or columns)."""
-        avgs = cumsum / (range_ * k)
-        log_probs = norm.logcdf(-avgs * np.sqrt(range_ * k))
-        return - log_probs - m_log_combs - n_log_combs[k-1]
+    return scores
 
-    def _log_combs(self, n):
-        """Calculates the log of n choose k for k ranging from 0 to n."""
-        log_facts = self._cum_log_factorial(n)
-        return log_facts[n] - (log_facts + log_facts[::-1])
 
-    def _cum_log_factorial(self, n):
-        """Calculates the log of the factorials from 0 to n."""
-        log_cumsum = np.cumsum(np.log(np.arange(1, n + 1)))
-        return np.append(0, log_cumsum) # 0 because log 0! = log 1 = 0, so this array will have size n + 1
+@njit(cache=True)
+def _search_scratch(num_rows, num_cols):
+    """Allocates the scratch buffers used by a search: two float rows (sums and top sums) and four
+    index rows (selection order, set difference and two sorted index sets) for each dimension."""
+    return (np.empty((2, num_rows)), np.empty((4, num_rows), dtype=np.int64),
+            np.empty((2, num_cols)), np.empty((4, num_cols), dtype=np.int64))
 
-    def _validate_parameters(self):
-        if self.num_biclusters <= 0:
-            raise ValueError("num_biclusters must be > 0, got {}".format(num_biclusters))
 
-        if self.randomized_searches <= 0:
-            raise ValueError("randomized_searches must be > 0, got {}".format(self.randomized_searches))
+@njit(cache=True)
+def _search_nb(data, data_F, k, l, col_perm, init_row_sums, row_log_combs, col_log_combs, tol, out_rows, out_cols, scratch):
+    """The basic bicluster search procedure, started from the k x l constraint and the first l
+    columns of col_perm. Returns the number of rows, the number of columns, the average and the
+    score of a submatrix that is a local maximum of the score function. Its rows and columns are
+    written into the first positions of out_rows and out_cols. scratch is given by _search_scratch.
+    """
+    _constrained_bicluster_nb(data, data_F, k, l, col_perm[:l], init_row_sums, out_rows[:k], out_cols[:l], tol, scratch)
+    return _improve_bicluster_nb(data, data_F, out_rows, k, out_cols, l, row_log_combs, col_log_combs, tol, scratch)
 
-        if not isinstance(self.transform, bool):
-            raise ValueError("transform must be either True or False, got {}".format(self.transform))
 
-        if self.tol <= 0.0:
-            raise ValueError("tol must be a small double > 0.0, got {}".format(self.tol))
+@njit(cache=True, fastmath={'reassoc', 'contract', 'arcp', 'nsz'}) # no 'nnan'/'ninf', since -inf starts the convergence check
+def _constrained_bicluster_nb(data, data_F, k, l, cols_init, init_row_sums, out_rows, out_cols, tol, scratch):
+    """Alternately selects the k rows and the l columns with the largest sums until the average
+    of the k x l submatrix converges. init_row_sums holds the row sums over cols_init, which are
+    computed in batch by the caller. The result is written into out_rows and out_cols."""
+    row_fscratch, row_iscratch, col_fscratch, col_iscratch = scratch
+
+    row_sums, top_row_sums = row_fscratch[0], row_fscratch[1, :k]
+    col_sums, top_col_sums = col_fscratch[0], col_fscratch[1, :l]
+    row_order, row_diff = row_iscratch[0], row_iscratch[1, :k]
+    col_order, col_diff = col_iscratch[0], col_iscratch[1, :l]
+
+    # sorted copies of the rows and columns of the previous and of the current iteration, which
+    # allow the sums to be updated only by the rows and columns that entered or left the bicluster
+    sorted_rows, new_sorted_rows = row_iscratch[2, :k], row_iscratch[3, :k]
+    sorted_cols, new_sorted_cols = col_iscratch[2, :l], col_iscratch[3, :l]
+
+    out_cols[:] = cols_init
+    row_sums[:] = init_row_sums
+    sorted_cols[:] = out_cols
+    sorted_cols.sort()
+
+    old_avg, avg = -np.inf, 0.0
+    first = True
+
+    while abs(avg - old_avg) > tol:
+        if not first: # the row sums of the first iteration are given by init_row_sums
+            new_sorted_cols[:] = out_cols
+            new_sorted_cols.sort()
+            _update_sums(data_F.T, sorted_cols, new_sorted_cols, row_sums, col_diff)
+            sorted_cols, new_sorted_cols = new_sorted_cols, sorted_cols
+
+        old_avg = avg
+
+        _top_k(row_sums, k, out_rows, top_row_sums, row_order)
+
+        new_sorted_rows[:] = out_rows
+        new_sorted_rows.sort()
+        if first:
+            _sum_rows(data, out_rows, col_sums)
+        else:
+            _update_sums(data, sorted_rows, new_sorted_rows, col_sums, row_diff)
+        sorted_rows, new_sorted_rows = new_sorted_rows, sorted_rows
+
+        _top_k(col_sums, l, out_cols, top_col_sums, col_order)
+
+        avg = np.sum(top_col_sums) / (k * l)
+        first = False
+
+
+@njit(cache=True)
+def _improve_bicluster_nb(data, data_F, rows, num_b_rows, cols, num_b_cols, row_log_combs, col_log_combs, tol, scratch):
+    """Relaxes the k x l bicluster constraint in order to maximize the score function locally.
+    The bicluster is given by rows[:num_b_rows] and cols[:num_b_cols], which are updated in place.
+    """
+    row_fscratch, row_iscratch, col_fscratch, col_iscratch = scratch
+
+    avg = 0.0
+    old_score, score = -np.inf, 0.0
+
+    while abs(score - old_score) > tol:
+        old_score = score
+
+        _sum_cols(data_F, cols[:num_b_cols], row_fscratch[0])
+        num_b_rows, _, _ = _best_prefix(num_b_rows, num_b_cols, row_log_combs, col_log_combs, rows, row_fscratch, row_iscratch) # searches for the number of rows that maximizes the score
+
+        _sum_rows(data, rows[:num_b_rows], col_fscratch[0])
+        num_b_cols, score, total = _best_prefix(num_b_cols, num_b_rows, col_log_combs, row_log_combs, cols, col_fscratch, col_iscratch) # searches for the number of columns that maximizes the score
+
+        avg = total / (num_b_rows * num_b_cols)
+
+    return num_b_rows, num_b_cols, avg, score
+
+
+@njit(cache=True)
+def _best_prefix(prev_size, k, m_log_combs, n_log_combs, out_idx, fscratch, iscratch):
+    """Searches for the number of rows (or columns) with the largest sums that maximizes the score
+    function. The sums are given by fscratch[0]. These rows are written into out_idx, and their
+    number, score and sum are returned.
+
+    Only the cap largest sums are sorted, where cap grows with the size of the previous solution,
+    since the best size is usually small and changes little between iterations. All sums are sorted
+    when the best size reaches cap, or when taking all rows (or columns) scores better, which is
+    the other end where the score function may peak, since log(n choose n) = 0.
+    """
+    sums = fscratch[0]
+    n = sums.size
+    cap = min(n, 4 * prev_size + 16)
+
+    if cap < n:
+        top, top_sums = iscratch[1, :cap], fscratch[1, :cap]
+        _quickselect_top_k(sums, cap, top, top_sums, iscratch[0])
+        prefix = top[np.argsort(-top_sums)]
+
+        size, score, total = _prefix_scores(sums, prefix, k, m_log_combs, n_log_combs)
+        all_score = -_log_ndtr(-np.sum(sums) / math.sqrt(n * k)) - m_log_combs[n-1] - n_log_combs[k-1]
+
+        if size < cap and score >= all_score:
+            out_idx[:size] = prefix[:size]
+            return size, score, total
+
+    prefix = np.argsort(-sums)
+    size, score, total = _prefix_scores(sums, prefix, k, m_log_combs, n_log_combs)
+    out_idx[:size] = prefix[:size]
+
+    return size, score, total
+
+
+@njit(cache=True)
+def _prefix_scores(sums, prefix, k, m_log_combs, n_log_combs):
+    """Calculates the score function for all possible numbers of rows (or columns), taken in the
+    given order, and returns the best size together with its score and the sum of its entries.
+    """
+    best_size, best_score, best_sum = 0, -np.inf, 0.0
+    cumsum = 0.0
+
+    for i in range(prefix.size):
+        cumsum += sums[prefix[i]]
+        n = (i + 1) * k
+        score = -_log_ndtr(-cumsum / math.sqrt(n)) - m_log_combs[i] - n_log_combs[k-1]
+
+        if score > best_score:
+            best_size, best_score, best_sum = i + 1, score, cumsum
+
+    return best_size, best_score, best_sum
+
+
+@njit(cache=True)
+def _log_ndtr(x):
+    """Calculates the log of the standard normal cumulative distribution function at x (the same
+    as scipy.special.log_ndtr) using only functions that are inlined by numba."""
+    if x > 0.0:
+        return math.log1p(-0.5 * math.erfc(x / _SQRT2))
+
+    if x > -20.0:
+        return math.log(0.5 * math.erfc(-x / _SQRT2))
+
+    # erfc underflows for very negative x, so the asymptotic expansion of the tail is used instead
+    x2 = x * x
+    return -0.5 * x2 - math.log(-x) - _LOG_SQRT_2PI + math.log1p((-1.0 + (3.0 - 15.0 / x2) / x2) / x2)
+
+
+@njit(cache=True)
+def _transform_and_scale(data):
+    """Replaces each x of the C-ordered data by sign(x) * log(1 + |x|) and scales the resulting columns
+    to zero mean and unit variance in place, as sklearn.preprocessing.scale would. Uses one pass over
+    data to transform it and accumulate the column statistics and another one to scale it."""
+    num_rows, num_cols = data.shape
+    shift = np.empty(num_cols)
+    sums = np.zeros(num_cols)
+    sq_sums = np.zeros(num_cols)
+    inv_stds = np.empty(num_cols)
+
+    # the statistics are accumulated relative to the first row, which keeps them exact for constant columns
+    for j in range(num_cols):
+        shift[j] = math.copysign(math.log1p(abs(data[0, j])), data[0, j])
+
+    for i in range(num_rows):
+        for j in range(num_cols):
+            x = math.copysign(math.log1p(abs(data[i, j])), data[i, j])
+            data[i, j] = x
+            d = x - shift[j]
+            sums[j] += d
+            sq_sums[j] += d * d
+
+    for j in range(num_cols):
+        mean = sums[j] / num_rows
+        var = max(sq_sums[j] / num_rows - mean * mean, 0.0)
+        shift[j] += mean
+        inv_stds[j] = 1.0 / math.sqrt(var) if var > 0.0 else 1.0 # columns with zero variance are only centered
+
+    for i in range(num_rows):
+        for j in range(num_cols):
+            data[i, j] = (data[i, j] - shift[j]) * inv_stds[j]
+
+
+@njit(cache=True)
+def _subtract_block(data, rows, cols, value):
+    """Subtracts value from the submatrix data[np.ix_(rows, cols)] in place, without building
+    the index arrays of np.ix_. The inner loop runs over cols, so data should be C-ordered."""
+    for i in range(rows.size):
+        r = rows[i]
+        for j in range(cols.size):
+            data[r, cols[j]] -= value
+
+
+@njit(cache=True, fastmath=True)
+def _sum_cols(data_F, cols, out):
+    """Sums the given columns of the Fortran-ordered data_F into out, one contiguous column at a time."""
+    out[:] = 0.0
+    _add_rows(data_F.T, cols, 1.0, out)
+
+
+@njit(cache=True, fastmath=True)
+def _sum_rows(data, rows, out):
+    """Sums the given rows of the C-ordered data into out, one contiguous row at a time."""
+    out[:] = 0.0
+    _add_rows(data, rows, 1.0, out)
+
+
+@njit(cache=True, fastmath=True)
+def _add_rows(data, rows, sign, out):
+    """Adds sign times each of the given rows of the C-ordered data to out."""
+    for i in range(rows.size):
+        row = data[rows[i]]
+        for j in range(out.size):
+            out[j] += sign * row[j]
+
+
+@njit(cache=True, fastmath=True)
+def _update_sums(data, old_rows, new_rows, sums, scratch):
+    """Updates sums, the sum of the sorted old_rows of the C-ordered data, to the sum of the sorted
+    new_rows, by subtracting the rows that left and adding the rows that entered. The sums are
+    recomputed from scratch when that is cheaper. scratch must have the size of new_rows."""
+    num_removed = _sorted_difference(old_rows, new_rows, scratch)
+
+    if 2 * num_removed >= new_rows.size:
+        sums[:] = 0.0
+        _add_rows(data, new_rows, 1.0, sums)
+    else:
+        _add_rows(data, scratch[:num_removed], -1.0, sums)
+        num_added = _sorted_difference(new_rows, old_rows, scratch)
+        _add_rows(data, scratch[:num_added], 1.0, sums)
+
+
+@njit(cache=True)
+def _sorted_difference(a, b, out):
+    """Writes into out the entries of the sorted array a that are not in the sorted array b, and
+    returns their number. Both arrays are merged in a single pass."""
+    n, j = 0, 0
+
+    for i in range(a.size):
+        while j < b.size and b[j] < a[i]:
+            j += 1
+
+        if j == b.size or b[j] != a[i]:
+            out[n] = a[i]
+            n += 1
+
+    return n
+
+
+@njit(cache=True)
+def _top_k(values, k, out_idx, out_vals, order):
+    """Writes into out_idx the indices of the k largest values and these values into out_vals.
+    Quickselect is used when k is a sizable fraction of the number of values, since a large heap is
+    slower. Otherwise a size-k min-heap is used, or a sorted buffer when k is at most _SMALL_K. order
+    is a scratch array with the same size as values."""
+    if k * _HEAP_SELECTION_RATIO > values.size:
+        _quickselect_top_k(values, k, out_idx, out_vals, order)
+    elif k <= _SMALL_K:
+        _insertion_top_k(values, k, out_idx, out_vals)
+    else:
+        for i in range(values.size):
+            _heap_offer(out_vals, out_idx, k, i, values[i], i)
+
+
+@njit(cache=True)
+def _quickselect_top_k(values, k, out_idx, out_vals, order):
+    """Writes into out_idx the indices of the k largest values and these values into out_vals."""
+    n = order.size
+
+    for i in range(n):
+        order[i] = i
+
+    lo, hi = 0, n - 1
+
+    while lo < hi:
+        pivot = values[order[(lo + hi) // 2]]
+        i, j = lo, hi
+
+        while i <= j:
+            while values[order[i]] > pivot:
+                i += 1
+            while values[order[j]] < pivot:
+                j -= 1
+            if i <= j:
+                order[i], order[j] = order[j], order[i]
+                i += 1
+                j -= 1
+
+        if k - 1 <= j:
+            hi = j
+        elif k - 1 >= i:
+            lo = i
+        else:
+            break
+
+    for i in range(k):
+        out_idx[i] = order[i]
+        out_vals[i] = values[order[i]]
+
+
+@njit(cache=True)
+def _insertion_top_k(values, k, out_idx, out_vals):
+    """Writes into out_idx the indices of the k largest values and these values into out_vals, which
+    is kept sorted in ascending order. Most values are rejected by a single comparison with the
+    smallest kept value, and the few accepted ones are inserted by shifting at most k entries."""
+    for i in range(values.size):
+        v = values[i]
+
+        if i < k: # fills the buffer by insertion sort
+            j = i
+            while j > 0 and out_vals[j-1] > v:
+                out_vals[j] = out_vals[j-1]
+                out_idx[j] = out_idx[j-1]
+                j -= 1
+
+        elif v > out_vals[0]: # drops the smallest kept value and inserts v in order
+            j = 0
+            while j + 1 < k and out_vals[j+1] < v:
+                out_vals[j] = out_vals[j+1]
+                out_idx[j] = out_idx[j+1]
+                j += 1
+
+        else:
+            continue
+
+        out_vals[j] = v
+        out_idx[j] = i
+
+
+@njit(cache=True)
+def _heap_offer(heap_vals, heap_idx, k, count, value, index):
+    """Offers the count-th (value, index) pair to a min-heap that keeps the k largest values offered so far."""
+    if count < k:
+        heap_vals[count] = value
+        heap_idx[count] = index
+
+        if count == k - 1: # the heap is full, so it can be heapified
+            for pos in range(k // 2 - 1, -1, -1):
+                _sift_down(heap_vals, heap_idx, k, pos, heap_vals[pos], heap_idx[pos])
+
+    elif value > heap_vals[0]:
+        _sift_down(heap_vals, heap_idx, k, 0, value, index)
+
+
+@njit(cache=True)
+def _sift_down(heap_vals, heap_idx, size, pos, value, index):
+    """Places (value, index) at position pos of the min-heap and moves it down until the heap property holds."""
+    while True:
+        child = 2 * pos + 1
+
+        if child >= size:
+            break
+
+        if child + 1 < size and heap_vals[child + 1] < heap_vals[child]:
+            child += 1
+
+        if heap_vals[child] >= value:
+            break
+
+        heap_vals[pos] = heap_vals[child]
+        heap_idx[pos] = heap_idx[child]
+        pos = child
+
+    heap_vals[pos] = value
+    heap_idx[pos] = index
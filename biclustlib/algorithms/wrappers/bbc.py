@@ -21,9 +21,10 @@
 from ._base import ExecutableWrapper
 from ...models import Bicluster, Biclustering
 from os.path import dirname, join
+from array import array
 
 import numpy as np
-import os, re
+import os
 
 class BayesianBiclustering(ExecutableWrapper):
     """Bayesian BiClustering (BBC)
@@ -82,30 +83,48 @@ class BayesianBiclustering(ExecutableWrapper):
 
         if os.path.exists(output_path):
             with open(output_path, 'r') as f:
-                content = f.read()
-                biclusters_str = re.split('bicluster[0-9]+\n', content)[1:]
+                rows = None
 
-                for b_str in biclusters_str:
-                    ground_effect = float(b_str.split('\n', 1)[0].split()[-1])
-                    rows, rows_effects = self._get_indices_and_effects(b_str, 'ROW_[0-9]+')
-                    cols, cols_effects = self._get_indices_and_effects(b_str, 'COL_[0-9]+')
-                    b_data = ground_effect + rows_effects[:, np.newaxis] + cols_effects
-                    biclusters.append(Bicluster(rows, cols, b_data))
+                for line in f:
+                    if line.startswith('bicluster') and line[9:].strip().isdigit():
+                        if rows is not None:
+                            biclusters.append(self._get_bicluster(ground_effect, rows, rows_effects, cols, cols_effects))
 
-        return Biclustering(biclusters)
+                        rows, rows_effects = array('q'), array('d')
+                        cols, cols_effects = array('q'), array('d')
+
+                    elif rows is None:
+                        continue
+
+                    elif line.startswith('bicluster main effect'):
+                        ground_effect = float(line.split()[-1])
 
-    def _get_indices_and_effects(self, bicluster_string, pattern):
-        matches = re.findall(pattern + '\t+\d+\.?\d+', bicluster_string)
+                    else:
+                        # effect lines have the format "index\tname\teffect", where name is ROW_i or COL_j
+                        start = line.find('\t') + 1
 
-        indices = []
-        effects = []
+                        if line.startswith('ROW_', start):
+                            end = line.index('\t', start)
+                            rows.append(int(line[start+4:end]))
+                            rows_effects.append(float(line[end+1:]))
 
-        for m in matches:
-            i, e = m.split('_')[1].split()
-            indices.append(i)
-            effects.append(e)
+                        elif line.startswith('COL_', start):
+                            end = line.index('\t', start)
+                            cols.append(int(line[start+4:end]))
+                            cols_effects.append(float(line[end+1:]))
+
+                if rows is not None:
+                    biclusters.append(self._get_bicluster(ground_effect, rows, rows_effects, cols, cols_effects))
+
+        return Biclustering(biclusters)
 
-        return np.array(indices, np.int), np.array(effects, np.double)
+    def _get_bicluster(self, ground_effect, rows, rows_effects, cols, cols_effects):
+        rows = np.frombuffer(rows, dtype=np.int64)
+        cols = np.frombuffer(cols, dtype=np.int64)
+        rows_effects = np.frombuffer(rows_effects, dtype=np.double)
+        cols_effects = np.frombuffer(cols_effects, dtype=np.double)
+        b_data = ground_effect + rows_effects[:, np.newaxis] + cols_effects
+        return Bicluster(rows, cols, b_data)
 
     def _validate_parameters(self):
         if self.num_biclusters <= 0: